@@ -0,0 +1,11 @@
+import os
+
+from dotenv import load_dotenv
+
+load_dotenv()
+
+DEFAULT_PATHWAY_HOST = "demo-document-indexing.pathway.stream"
+
+PATHWAY_HOST = os.environ.get("PATHWAY_HOST", DEFAULT_PATHWAY_HOST)
+
+PATHWAY_PORT = int(os.environ.get("PATHWAY_PORT", "80"))
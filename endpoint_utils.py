@@ -1,4 +1,5 @@
 import datetime
+import posixpath
 import sys
 
 import streamlit as st
@@ -21,7 +22,7 @@ def get_inputs() -> tuple[str, list[str]]:
             status = added_file.get("status")
             if full_path is None:
                 continue
-            name = full_path.split("/")[-1]
+            name = posixpath.basename(full_path)
             last_indexed_files.append([name, status])
 
             formatted_time = datetime.datetime.fromtimestamp(last_modified)
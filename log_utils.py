@@ -4,6 +4,7 @@ import logging
 import os
 import sys
 
+from dotenv import load_dotenv
 from opentelemetry._logs import set_logger_provider
 from opentelemetry.exporter.otlp.proto.grpc._log_exporter import OTLPLogExporter
 from opentelemetry.sdk._logs import LoggerProvider, LoggingHandler
@@ -15,6 +16,8 @@ from opentelemetry.sdk.resources import (
     Resource,
 )
 
+load_dotenv()
+
 PATHWAY_TELEMETRY_ENDPOINT = os.environ.get("PATHWAY_TELEMETRY_SERVER")
 APP_NAME = os.environ.get("APP_NAME")
 PATHWAY_SERVICE_INSTANCE_ID = os.environ.get("PATHWAY_SERVICE_INSTANCE_ID")
@@ -32,6 +35,29 @@ resource = Resource(
 )
 
 
+try:
+    import orjson
+
+    def _dumps(payload: dict) -> str:
+        return orjson.dumps(payload, default=str).decode()
+
+except ImportError:
+    import json
+
+    def _dumps(payload: dict) -> str:
+        return json.dumps(payload, separators=(",", ":"), default=str)
+
+
+def log_event(_type: str, level: int = logging.INFO, **fields) -> None:
+    """Emit one structured log line for the given event type.
+
+    Serialization goes through orjson when it is installed (an order of
+    magnitude faster than stdlib json) and falls back to compact json.dumps
+    otherwise, so callers never pay for pretty separators on the hot path.
+    """
+    logging.log(level, _dumps({"_type": _type, **fields}))
+
+
 def init_pw_log_config():
     if PATHWAY_TELEMETRY_ENDPOINT is not None:
         exporter = OTLPLogExporter(endpoint=PATHWAY_TELEMETRY_ENDPOINT)
@@ -1,6 +1,8 @@
 import os
+import threading
+from concurrent.futures import ThreadPoolExecutor
 
-from dotenv import load_dotenv
+from config import PATHWAY_HOST, PATHWAY_PORT
 from llama_index.chat_engine.condense_plus_context import CondensePlusContextChatEngine
 from llama_index.llms.openai import OpenAI
 from llama_index.llms.types import ChatMessage, MessageRole
@@ -10,16 +12,13 @@ from traceloop.sdk import Traceloop
 
 from pathway.xpacks.llm.vector_store import VectorStoreClient
 
-load_dotenv()
-
-
 Traceloop.init(app_name=os.environ.get("APP_NAME", "PW - LlamaIndex (Streamlit)"))
 
-DEFAULT_PATHWAY_HOST = "demo-document-indexing.pathway.stream"
-
-PATHWAY_HOST = os.environ.get("PATHWAY_HOST", DEFAULT_PATHWAY_HOST)
+# Cap concurrent RAG round-trips per process; excess sessions queue here
+# instead of piling load onto the retriever and LLM backends at once.
+MAX_CONCURRENT_CHATS = int(os.environ.get("MAX_CONCURRENT_CHATS", "4"))
 
-PATHWAY_PORT = int(os.environ.get("PATHWAY_PORT", "80"))
+chat_slots = threading.Semaphore(MAX_CONCURRENT_CHATS)
 
 
 def get_additional_headers():
@@ -54,11 +53,39 @@ DEFAULT_MESSAGES = [
     ChatMessage(role=MessageRole.ASSISTANT, content=pathway_explaination),
 ]
 
-chat_engine = CondensePlusContextChatEngine.from_defaults(
-    retriever=retriever,
-    system_prompt="""You are RAG AI that answers users questions based on provided sources.
+_prefetch_pool = ThreadPoolExecutor(max_workers=1, thread_name_prefix="rag-prefetch")
+
+
+def prefetch_context(prompt: str) -> None:
+    """Warm the retrieval path for ``prompt`` without blocking the caller.
+
+    The chat engine spends an LLM round-trip condensing the question before
+    it retrieves; firing a retrieval in the background overlaps the two, so
+    the Pathway connection and server-side lookup are hot by the time the
+    engine asks. Purely a warm-up: the result is discarded and failures are
+    ignored.
+    """
+
+    def _fetch():
+        try:
+            retriever.retrieve(prompt)
+        except Exception:
+            pass
+
+    _prefetch_pool.submit(_fetch)
+
+
+def make_chat_engine(chat_history=None):
+    """Build a chat engine with its own history list.
+
+    Each caller (e.g. each Streamlit session) gets an independent engine, so
+    one session's history never leaks into another's.
+    """
+    return CondensePlusContextChatEngine.from_defaults(
+        retriever=retriever,
+        system_prompt="""You are RAG AI that answers users questions based on provided sources.
     IF QUESTION IS NOT RELATED TO ANY OF THE CONTEXT DOCUMENTS, SAY IT'S NOT POSSIBLE TO ANSWER USING PHRASE `The looked-up documents do not provde information about...`""",
-    verbose=True,
-    chat_history=DEFAULT_MESSAGES,
-    llm=llm,
-)
+        verbose=True,
+        chat_history=list(chat_history if chat_history is not None else DEFAULT_MESSAGES),
+        llm=llm,
+    )
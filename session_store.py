@@ -0,0 +1,28 @@
+"""In-process store of chat transcripts keyed by session id.
+
+Streamlit drops ``st.session_state`` whenever the websocket reconnects; this
+keeps each session's transcript alive server-side, keyed by the session id
+the client carries in its ``sid`` query param, so a reconnecting client
+resumes where it left off instead of restarting the conversation.
+"""
+
+import threading
+
+_LOCK = threading.Lock()
+_STORE: dict[str, list[dict]] = {}
+_MAX_SESSIONS = 1000
+
+
+def load_messages(session_id: str) -> list[dict] | None:
+    """Return a copy of the stored transcript, or None if unknown."""
+    with _LOCK:
+        messages = _STORE.get(session_id)
+        return list(messages) if messages else None
+
+
+def save_messages(session_id: str, messages: list[dict]) -> None:
+    """Store a snapshot of the transcript, evicting the oldest session if full."""
+    with _LOCK:
+        if session_id not in _STORE and len(_STORE) >= _MAX_SESSIONS:
+            _STORE.pop(next(iter(_STORE)))
+        _STORE[session_id] = list(messages)